@@ -1,225 +1,548 @@
 # -*- coding: utf-8 -*-
 import os
-import json
-import requests
-from flask import Flask, request, jsonify, render_template, session
-from flask_cors import CORS
 from dotenv import load_dotenv
-import time
-from collections import defaultdict
-import base64
 
 # Load environment variables
 load_dotenv()
 
+# When run directly in production the app is served by gevent. The stdlib is patched once .env has been read (so
+# FLASK_ENV set there is honoured) but before Flask, requests and the app's own modules are imported; only os and
+# dotenv (with the logging and threading modules it pulls in) load ahead of the patch
+if __name__ == '__main__' and os.environ.get('FLASK_ENV') != 'development':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, Response, request, jsonify, session
+from flask.json.provider import DefaultJSONProvider
+from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+from simple_openai import AdvancedOpenAI
+import time
+import math
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+import base64
+import hashlib
+import gzip
+import uuid
+import orjson
+
+# Outside development only warnings and errors are emitted, keeping per-request logging off the hot path
+logging.basicConfig(level=logging.INFO if os.environ.get('FLASK_ENV') == 'development' else logging.WARNING)
+logger = logging.getLogger(__name__)
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that uses orjson for jsonify() and request.get_json()"""
+    
+    option = orjson.OPT_NON_STR_KEYS
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=self.option), mimetype=self.mimetype)
+
 app = Flask(__name__)
+# X-Forwarded-* headers are only trusted when that many proxies (e.g. the platform router) sit in front of the
+# app; otherwise any client could set its own address and dodge the rate limiter
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+app.json = ORJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+# Oversized uploads are rejected with 413 before their body is read or parsed
+app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB
 CORS(app)
 
-# Rate limiting
-rate_limits = defaultdict(list)
+# Environment is fixed for the life of the process
+FLASK_ENV = os.environ.get('FLASK_ENV')
+ENVIRONMENT = 'production' if FLASK_ENV == 'production' else 'development'
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
+GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+
+# Provider request headers only depend on the keys above, so they are built once
+OPENAI_HEADERS = {
+    'Authorization': f'Bearer {OPENAI_API_KEY}',
+    'Content-Type': 'application/json'
+}
+ANTHROPIC_HEADERS = {
+    'x-api-key': ANTHROPIC_API_KEY,
+    'Content-Type': 'application/json',
+    'anthropic-version': '2023-06-01'
+}
+GEMINI_HEADERS = {
+    'x-goog-api-key': GOOGLE_API_KEY,
+    'Content-Type': 'application/json'
+}
+GEMINI_API_URL = 'https://generativelanguage.googleapis.com/v1beta/models'
+
+# Shared AI client (also keeps conversation history across requests)
+ai = AdvancedOpenAI()
+
+# Provider calls made directly from this module reuse ai's pooled keep-alive connections
+http_session = ai.session
+
+# Seconds /api/real-time/all waits for its lookups before reporting the stragglers as unavailable
+REAL_TIME_ALL_TIMEOUT = 5
+
+# Rate limiting (token bucket per client address and endpoint: (client_ip, endpoint) -> (tokens, last_refill))
+rate_limits = OrderedDict()
+rate_limits_lock = threading.Lock()
 RATE_LIMIT_WINDOW = 60  # 1 minute
 MAX_REQUESTS_PER_WINDOW = 10
+MAX_TRACKED_CLIENTS = 10000  # Least recently seen buckets are evicted beyond this
+
+# Per-endpoint overrides of MAX_REQUESTS_PER_WINDOW
+ENDPOINT_RATE_LIMITS = {
+    'compare_models': 5,  # Each request fans out to several providers
+    'debug': 60
+}
+
+# Precomputed (capacity, tokens per second) for each endpoint
+DEFAULT_RATE_LIMIT_BUCKET = (MAX_REQUESTS_PER_WINDOW, MAX_REQUESTS_PER_WINDOW / RATE_LIMIT_WINDOW)
+RATE_LIMIT_BUCKETS = {endpoint: (limit, limit / RATE_LIMIT_WINDOW) for endpoint, limit in ENDPOINT_RATE_LIMITS.items()}
 
-def check_rate_limit(user_id):
-    """Check if user has exceeded rate limit"""
-    current_time = time.time()
-    user_requests = rate_limits[user_id]
+# (connect, read) bounds in seconds on a single AI provider call so a stalled upstream can't hold a worker
+UPSTREAM_TIMEOUT = (5, 60)
+
+# Fixed error bodies are serialized once instead of on every rejected request
+RATE_LIMIT_EXCEEDED_JSON = orjson.dumps({'success': False, 'error': 'Rate limit exceeded. Please try again later.'})
+MESSAGE_REQUIRED_JSON = orjson.dumps({'success': False, 'error': 'Message is required'})
+MODELS_REQUIRED_JSON = orjson.dumps({'success': False, 'error': 'Models must be a list of model names'})
+NOT_FOUND_JSON = orjson.dumps({'error': 'Endpoint not found'})
+INTERNAL_ERROR_JSON = orjson.dumps({'error': 'Internal server error'})
+PAYLOAD_TOO_LARGE_JSON = orjson.dumps({'success': False, 'error': 'Payload too large'})
+
+def json_response(body, status=200, headers=None):
+    """Wrap pre-serialized JSON bytes in a response"""
+    return app.response_class(body, status=status, headers=headers, mimetype='application/json')
+
+def check_rate_limit(client_ip, endpoint=None):
+    """Consume a request token, returning 0 if allowed or the seconds until the next token"""
+    capacity, refill_rate = RATE_LIMIT_BUCKETS.get(endpoint, DEFAULT_RATE_LIMIT_BUCKET)
+    key = (client_ip, endpoint)
     
-    # Remove old requests outside the window
-    user_requests[:] = [req_time for req_time in user_requests if current_time - req_time < RATE_LIMIT_WINDOW]
+    with rate_limits_lock:
+        current_time = time.time()
+        tokens, last_refill = rate_limits.get(key, (capacity, current_time))
+        
+        # Refill tokens for the time elapsed since the last request
+        tokens = min(capacity, tokens + (current_time - last_refill) * refill_rate)
+        
+        if tokens < 1:
+            return (1 - tokens) / refill_rate
+        
+        rate_limits[key] = (tokens - 1, current_time)
+        rate_limits.move_to_end(key)
+        if len(rate_limits) > MAX_TRACKED_CLIENTS:
+            rate_limits.popitem(last=False)
+        return 0
+
+def rate_limit_exceeded(retry_after, endpoint=None):
+    """Build the 429 response telling the client when it may retry"""
+    capacity, _ = RATE_LIMIT_BUCKETS.get(endpoint, DEFAULT_RATE_LIMIT_BUCKET)
+    retry_after = math.ceil(retry_after)
+    headers = {
+        'Retry-After': str(retry_after),
+        'X-RateLimit-Limit': str(capacity),
+        'X-RateLimit-Remaining': '0',
+        'X-RateLimit-Reset': str(int(time.time()) + retry_after)
+    }
+    return json_response(RATE_LIMIT_EXCEEDED_JSON, 429, headers)
+
+def get_user_id():
+    """Get the current session's user id, assigning one on first use"""
+    # Only write to the session when the id is new, so the signed cookie isn't re-issued on every response
+    user_id = session.get('user_id')
+    if user_id is None:
+        user_id = session['user_id'] = uuid.uuid4().hex
+    return user_id
+
+def limit_request():
+    """Assign the session's conversation id and spend a rate limit token, returning a 429 response if none is left"""
+    # Routes call this only after validating their input, so malformed requests don't consume a token.
+    # Limits are per client address rather than per session id, so dropping the session cookie doesn't reset them
+    get_user_id()
+    retry_after = check_rate_limit(request.remote_addr, request.endpoint)
+    if retry_after:
+        return rate_limit_exceeded(retry_after, request.endpoint)
+    return None
+
+# Response cache for repeated stateless prompts (key -> (expires_at, payload))
+response_cache = OrderedDict()
+response_cache_lock = threading.Lock()
+RESPONSE_CACHE_TTL = 300  # 5 minutes
+RESPONSE_CACHE_MAX_ENTRIES = 4096
+
+def response_cache_key(*parts):
+    """Build a compact cache key from the request fields that determine the answer"""
+    return hashlib.blake2b('\0'.join(parts).encode('utf-8'), digest_size=16).digest()
+
+def get_cached_response(key):
+    """Return a cached response payload, or None if missing or expired"""
+    with response_cache_lock:
+        entry = response_cache.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, payload = entry
+        if expires_at < time.time():
+            del response_cache[key]
+            return None
+        
+        response_cache.move_to_end(key)
+        return payload
+
+def cache_response(key, payload, ttl=RESPONSE_CACHE_TTL):
+    """Store a response payload, evicting the least recently used entry when full"""
+    with response_cache_lock:
+        response_cache[key] = (time.time() + ttl, payload)
+        response_cache.move_to_end(key)
+        if len(response_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+            response_cache.popitem(last=False)
+
+# Response timestamps only carry second precision, so each second is formatted once
+timestamp_cache = (0, '')
+
+def current_timestamp():
+    """Get the current local time as an ISO 8601 string, cached per second"""
+    global timestamp_cache
+    second = int(time.time())
+    cached_second, cached_value = timestamp_cache
+    if second != cached_second:
+        cached_value = datetime.fromtimestamp(second).isoformat()
+        timestamp_cache = (second, cached_value)
+    return cached_value
+
+# Bodies smaller than this gain too little from gzip to be worth compressing
+GZIP_MIN_SIZE = 500
+GZIP_LEVEL = 5
+
+def accepts_gzip():
+    """Check whether the client accepts gzip-encoded responses"""
+    return request.accept_encodings['gzip'] > 0
+
+@app.after_request
+def compress_response(response):
+    """Gzip sizeable JSON responses for clients that accept it"""
+    # Streams, pre-encoded assets and non-JSON bodies are sent as they are
+    if response.is_streamed or response.content_encoding or response.mimetype != 'application/json':
+        return response
     
-    if len(user_requests) >= MAX_REQUESTS_PER_WINDOW:
-        return False
+    body = response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
     
-    user_requests.append(current_time)
-    return True
+    response.vary.add('Accept-Encoding')
+    if accepts_gzip():
+        response.set_data(gzip.compress(body, GZIP_LEVEL))
+        response.content_encoding = 'gzip'
+    return response
+
+def make_asset(body):
+    """Pair fixed response bytes with their ETag and, when worthwhile, a gzipped copy"""
+    gzipped = gzip.compress(body, 9) if len(body) >= GZIP_MIN_SIZE else None
+    return body, hashlib.blake2b(body, digest_size=16).hexdigest(), gzipped
+
+def load_static_asset(*path):
+    """Read a bundled file and compute its ETag"""
+    with open(os.path.join(app.root_path, *path), 'rb') as f:
+        return make_asset(f.read())
+
+# The chat page and PWA files never change while the process runs, so they are read once at startup
+INDEX_PAGE = load_static_asset('templates', 'chat.html')
+MANIFEST = load_static_asset('static', 'manifest.json')
+SERVICE_WORKER = load_static_asset('static', 'sw.js')
+
+# The manifest may be cached for a day; sw.js stays revalidated so service worker updates roll out promptly
+MANIFEST_MAX_AGE = 86400
+
+def static_asset_response(asset, mimetype, max_age=None):
+    """Serve a preloaded asset, answering matching conditional requests with 304"""
+    body, etag, gzipped = asset
+    if gzipped and accepts_gzip():
+        response = app.response_class(gzipped, mimetype=mimetype)
+        response.content_encoding = 'gzip'
+        etag += '-gzip'
+    else:
+        response = app.response_class(body, mimetype=mimetype)
+    if gzipped:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    # Without a max_age browsers must revalidate, which costs a 304 rather than the full body
+    if max_age is None:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    return response.make_conditional(request)
 
 @app.route('/')
 def index():
-    return render_template('chat.html')
+    return static_asset_response(INDEX_PAGE, 'text/html')
 
 @app.route('/manifest.json')
 def manifest():
     """Serve the PWA manifest file"""
-    return app.send_static_file('manifest.json')
+    return static_asset_response(MANIFEST, 'application/json', max_age=MANIFEST_MAX_AGE)
 
 @app.route('/sw.js')
 def service_worker():
     """Serve the service worker file"""
-    return app.send_static_file('sw.js')
+    return static_asset_response(SERVICE_WORKER, 'text/javascript')
 
 @app.route('/debug')
 def debug():
     """Debug endpoint to test backend connectivity"""
+    retry_after = check_rate_limit(request.remote_addr, request.endpoint)
+    if retry_after:
+        return rate_limit_exceeded(retry_after, request.endpoint)
+    
     return jsonify({
         'status': 'Backend is running',
         'timestamp': time.time(),
-        'environment': 'production' if os.environ.get('FLASK_ENV') == 'production' else 'development'
+        'environment': ENVIRONMENT
     })
 
+# Provider serving each model-name prefix ('gpt-4o' -> 'openai')
+PROVIDER_PREFIXES = {'gpt': 'openai', 'claude': 'anthropic', 'gemini': 'google'}
+
+def model_provider(model):
+    """Get the provider for a model name, or None if unsupported"""
+    if not isinstance(model, str):
+        return None
+    return PROVIDER_PREFIXES.get(model.split('-', 1)[0])
+
+def has_message(data):
+    """Check that a request body is an object with a non-empty string message"""
+    return isinstance(data, dict) and isinstance(data.get('message'), str) and bool(data['message'])
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Main chat endpoint supporting multiple AI models"""
-    try:
-        data = request.get_json()
-        message = data.get('message', '')
-        model = data.get('model', 'gpt-4o')  # Default to GPT-4o
-        use_memory = data.get('use_memory', True)
-        
-        # Check rate limit
-        user_id = session.get('user_id', 'anonymous')
-        if not check_rate_limit(user_id):
-            return jsonify({'success': False, 'error': 'Rate limit exceeded. Please try again later.'}), 429
-        
-        # Route to appropriate AI model
-        if model.startswith('gpt'):
-            return chat_with_openai(message, model, use_memory)
-        elif model.startswith('claude'):
-            return chat_with_claude(message, model, use_memory)
-        elif model.startswith('gemini'):
-            return chat_with_gemini(message, model, use_memory)
-        else:
-            return jsonify({'success': False, 'error': f'Unsupported model: {model}'}), 400
-            
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    data = request.get_json(silent=True)
+    
+    if not has_message(data):
+        return json_response(MESSAGE_REQUIRED_JSON, 400)
+    
+    message = data['message']
+    model = data.get('model', 'gpt-4o')  # Default to GPT-4o
+    use_memory = data.get('use_memory', True)
+    
+    provider = model_provider(model)
+    if not provider:
+        return jsonify({'success': False, 'error': f'Unsupported model: {model}'}), 400
+    
+    limited = limit_request()
+    if limited:
+        return limited
+    
+    # Stream tokens as they arrive instead of waiting for the full completion
+    if data.get('stream'):
+        return Response(STREAM_HANDLERS[provider](message, model), mimetype='text/event-stream')
+    
+    # Requests without conversation memory can be answered from the cache; "from_cache": false forces a fresh answer
+    cache_key = None if use_memory else response_cache_key(model, message)
+    if cache_key and data.get('from_cache', True):
+        cached = get_cached_response(cache_key)
+        if cached:
+            return jsonify(cached)
+    
+    payload, status = CHAT_HANDLERS[provider](message, model, use_memory)
+    
+    # Errors are never cached; cached copies carry when they were produced
+    if cache_key and status == 200:
+        cache_response(cache_key, dict(payload, from_cache=int(time.time())))
+    return payload, status
+
+def image_request_data():
+    """Read the image chat payload from either a JSON body or a multipart upload"""
+    if request.mimetype != 'multipart/form-data':
+        return request.get_json(silent=True)
+    
+    # Multipart uploads carry the raw image bytes, so they are base64-encoded only once for the upstream payload
+    data = request.form.to_dict()
+    for flag in ('use_memory', 'stream'):
+        if flag in data:
+            data[flag] = data[flag].lower() in ('1', 'true', 'on')
+    image = request.files.get('image')
+    if image:
+        mimetype = image.mimetype if image.mimetype.startswith('image/') else 'image/jpeg'
+        data['image_data'] = f"data:{mimetype};base64,{base64.b64encode(image.read()).decode('ascii')}"
+    return data
 
 @app.route('/api/chat-with-image', methods=['POST'])
 def chat_with_image():
     """Chat with image using multiple AI models"""
-    try:
-        data = request.get_json()
-        message = data.get('message', '')
-        image_data = data.get('image_data', '')
-        model = data.get('model', 'gpt-4o')  # Default to GPT-4o for image analysis
-        use_memory = data.get('use_memory', True)
-        
-        # Check rate limit
-        user_id = session.get('user_id', 'anonymous')
-        if not check_rate_limit(user_id):
-            return jsonify({'success': False, 'error': 'Rate limit exceeded. Please try again later.'}), 429
-        
-        # Route to appropriate AI model (only GPT-4o supports images currently)
-        if model.startswith('gpt'):
-            return chat_with_openai_image(message, image_data, use_memory)
-        else:
-            return jsonify({'success': False, 'error': f'Image analysis not supported for model: {model}'}), 400
-            
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    data = image_request_data()
+    
+    if not has_message(data):
+        return json_response(MESSAGE_REQUIRED_JSON, 400)
+    if not isinstance(data.get('image_data'), str) or not data['image_data']:
+        return jsonify({'success': False, 'error': 'Image data is required'}), 400
+    
+    message = data['message']
+    image_data = data['image_data']
+    model = data.get('model', 'gpt-4o')  # Default to GPT-4o for image analysis
+    use_memory = data.get('use_memory', True)
+    
+    # Only GPT-4o supports images currently
+    provider = model_provider(model)
+    if provider not in IMAGE_HANDLERS:
+        return jsonify({'success': False, 'error': f'Image analysis not supported for model: {model}'}), 400
+    
+    limited = limit_request()
+    if limited:
+        return limited
+    
+    if data.get('stream'):
+        return Response(IMAGE_STREAM_HANDLERS[provider](message, image_data), mimetype='text/event-stream')
+    
+    return IMAGE_HANDLERS[provider](message, image_data, use_memory)
 
 @app.route('/api/chat-with-document', methods=['POST'])
 def chat_with_document():
     """Chat with document using multiple AI models"""
-    try:
-        data = request.get_json()
-        message = data.get('message', '')
-        document_data = data.get('document_data', '')
-        document_name = data.get('document_name', 'Document')
-        model = data.get('model', 'gpt-4o')  # Default to GPT-4o
-        use_memory = data.get('use_memory', True)
-        
-        # Check rate limit
-        user_id = session.get('user_id', 'anonymous')
-        if not check_rate_limit(user_id):
-            return jsonify({'success': False, 'error': 'Rate limit exceeded. Please try again later.'}), 429
-        
-        # Route to appropriate AI model
-        if model.startswith('gpt'):
-            return chat_with_openai_document(message, document_data, document_name, use_memory)
-        elif model.startswith('claude'):
-            return chat_with_claude_document(message, document_data, document_name, use_memory)
-        elif model.startswith('gemini'):
-            return chat_with_gemini_document(message, document_data, document_name, use_memory)
-        else:
-            return jsonify({'success': False, 'error': f'Unsupported model: {model}'}), 400
-            
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    data = request.get_json(silent=True)
+    
+    if not has_message(data):
+        return json_response(MESSAGE_REQUIRED_JSON, 400)
+    if not isinstance(data.get('document_data'), str) or not data['document_data']:
+        return jsonify({'success': False, 'error': 'Document data is required'}), 400
+    
+    message = data['message']
+    document_data = data['document_data']
+    document_name = data.get('document_name', 'Document')
+    model = data.get('model', 'gpt-4o')  # Default to GPT-4o
+    use_memory = data.get('use_memory', True)
+    
+    provider = model_provider(model)
+    if not provider:
+        return jsonify({'success': False, 'error': f'Unsupported model: {model}'}), 400
+    
+    limited = limit_request()
+    if limited:
+        return limited
+    
+    if data.get('stream'):
+        return Response(DOCUMENT_STREAM_HANDLERS[provider](message, document_data, document_name), mimetype='text/event-stream')
+    
+    return DOCUMENT_HANDLERS[provider](message, document_data, document_name, use_memory)
+
+def compare_model_response(model, message, use_memory):
+    """Get one model's answer, or its error text, for /api/compare-models"""
+    handler = CHAT_HANDLERS.get(model_provider(model))
+    if not handler:
+        return None
+    
+    payload, status = handler(message, model, use_memory)
+    if status != 200:
+        return f"Error: {payload['error']}"
+    return payload['response']
 
 @app.route('/api/compare-models', methods=['POST'])
 def compare_models():
     """Compare responses from multiple AI models"""
-    try:
-        data = request.get_json()
-        message = data.get('message', '')
-        models = data.get('models', ['gpt-4o', 'claude-3-sonnet', 'gemini-1.5-pro'])
-        use_memory = data.get('use_memory', True)
-        
-        # Check rate limit
-        user_id = session.get('user_id', 'anonymous')
-        if not check_rate_limit(user_id):
-            return jsonify({'success': False, 'error': 'Rate limit exceeded. Please try again later.'}), 429
-        
-        # Get responses from all models
-        responses = {}
-        for model in models:
+    data = request.get_json(silent=True)
+    
+    if not has_message(data):
+        return json_response(MESSAGE_REQUIRED_JSON, 400)
+    
+    message = data['message']
+    models = data.get('models', ['gpt-4o', 'claude-3-sonnet', 'gemini-1.5-pro'])
+    use_memory = data.get('use_memory', True)
+    
+    if not isinstance(models, list) or not all(isinstance(model, str) for model in models):
+        return json_response(MODELS_REQUIRED_JSON, 400)
+    
+    # Repeated names would pay for the same answer twice
+    models = list(dict.fromkeys(models))
+    if len(models) > MAX_COMPARE_MODELS:
+        return jsonify({'success': False, 'error': f'At most {MAX_COMPARE_MODELS} models can be compared at once'}), 400
+    
+    limited = limit_request()
+    if limited:
+        return limited
+    
+    # Query every model at once so the total latency is the slowest model rather than the sum; the pool is
+    # per request so one large comparison can't queue other users' comparisons behind it
+    responses = {}
+    with ThreadPoolExecutor(max_workers=max(len(models), 1)) as executor:
+        futures = {model: executor.submit(compare_model_response, model, message, use_memory) for model in models}
+        for model, future in futures.items():
             try:
-                if model.startswith('gpt'):
-                    response = chat_with_openai(message, model, use_memory)
-                    if response[1] == 200:
-                        responses[model] = response[0].get_json()['response']
-                    else:
-                        responses[model] = f"Error: {response[0].get_json()['error']}"
-                elif model.startswith('claude'):
-                    response = chat_with_claude(message, model, use_memory)
-                    if response[1] == 200:
-                        responses[model] = response[0].get_json()['response']
-                    else:
-                        responses[model] = f"Error: {response[0].get_json()['error']}"
-                elif model.startswith('gemini'):
-                    response = chat_with_gemini(message, model, use_memory)
-                    if response[1] == 200:
-                        responses[model] = response[0].get_json()['response']
-                    else:
-                        responses[model] = f"Error: {response[0].get_json()['error']}"
+                response = future.result()
             except Exception as e:
-                responses[model] = f"Error: {str(e)}"
-        
-        return jsonify({
-            'success': True,
-            'responses': responses,
-            'message': message,
-            'models_compared': models
-        })
-        
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+                response = f"Error: {str(e)}"
+            if response is not None:
+                responses[model] = response
+    
+    return jsonify({
+        'success': True,
+        'responses': responses,
+        'message': message,
+        'models_compared': models
+    })
+
+# Model catalogue served by /api/models
+AVAILABLE_MODELS = {
+    'openai': [
+        {'id': 'gpt-4o', 'name': 'GPT-4o', 'description': 'Latest OpenAI model with enhanced capabilities', 'supports_images': True},
+        {'id': 'gpt-4-turbo', 'name': 'GPT-4 Turbo', 'description': 'Fast and efficient GPT-4 variant', 'supports_images': False},
+        {'id': 'gpt-3.5-turbo', 'name': 'GPT-3.5 Turbo', 'description': 'Fast and cost-effective model', 'supports_images': False}
+    ],
+    'anthropic': [
+        {'id': 'claude-3-sonnet', 'name': 'Claude 3.5 Sonnet', 'description': 'Anthropic\'s most capable model', 'supports_images': False},
+        {'id': 'claude-3-haiku', 'name': 'Claude 3 Haiku', 'description': 'Fast and efficient Claude model', 'supports_images': False}
+    ],
+    'google': [
+        {'id': 'gemini-1.5-pro', 'name': 'Gemini 1.5 Pro', 'description': 'Google\'s most advanced AI model', 'supports_images': False},
+        {'id': 'gemini-1.5-flash', 'name': 'Gemini 1.5 Flash', 'description': 'Fast and efficient Gemini model', 'supports_images': False}
+    ]
+}
+
+# /api/compare-models compares at most one call per catalogued model, so a single request can't fan out without bound
+MAX_COMPARE_MODELS = sum(len(models) for models in AVAILABLE_MODELS.values())
+
+# Static JSON bodies, serialized once at startup
+MODELS = make_asset(orjson.dumps({'success': True, 'models': AVAILABLE_MODELS}))
+REAL_TIME_CAPABILITIES = make_asset(orjson.dumps({
+    'success': True,
+    'capabilities': ai.get_real_time_capabilities(),
+    'note': 'Some services require API keys to be configured'
+}))
+AVAILABLE_PERSONALITIES = ai.get_available_personalities()
+
+# /api/personalities only varies by the session's current personality, so each variant is serialized once
+PERSONALITIES_RESPONSES = {
+    personality: make_asset(orjson.dumps({
+        'success': True,
+        'personalities': AVAILABLE_PERSONALITIES,
+        'current_personality': personality
+    }))
+    for personality in AVAILABLE_PERSONALITIES
+}
 
 @app.route('/api/models', methods=['GET'])
 def get_available_models():
     """Get list of available AI models"""
-    models = {
-        'openai': [
-            {'id': 'gpt-4o', 'name': 'GPT-4o', 'description': 'Latest OpenAI model with enhanced capabilities', 'supports_images': True},
-            {'id': 'gpt-4-turbo', 'name': 'GPT-4 Turbo', 'description': 'Fast and efficient GPT-4 variant', 'supports_images': False},
-            {'id': 'gpt-3.5-turbo', 'name': 'GPT-3.5 Turbo', 'description': 'Fast and cost-effective model', 'supports_images': False}
-        ],
-        'anthropic': [
-            {'id': 'claude-3-sonnet', 'name': 'Claude 3.5 Sonnet', 'description': 'Anthropic\'s most capable model', 'supports_images': False},
-            {'id': 'claude-3-haiku', 'name': 'Claude 3 Haiku', 'description': 'Fast and efficient Claude model', 'supports_images': False}
-        ],
-        'google': [
-            {'id': 'gemini-1.5-pro', 'name': 'Gemini 1.5 Pro', 'description': 'Google\'s most advanced AI model', 'supports_images': False},
-            {'id': 'gemini-1.5-flash', 'name': 'Gemini 1.5 Flash', 'description': 'Fast and efficient Gemini model', 'supports_images': False}
-        ]
-    }
-    
-    return jsonify({'success': True, 'models': models})
+    return static_asset_response(MODELS, 'application/json')
 
 # OpenAI Integration
 def chat_with_openai(message, model='gpt-4o', use_memory=True):
     """Chat with OpenAI models"""
     try:
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            return jsonify({'success': False, 'error': 'OpenAI API key not configured'}), 500
-        
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
+        if not OPENAI_API_KEY:
+            return {'success': False, 'error': 'OpenAI API key not configured'}, 500
         
         data = {
             'model': model,
@@ -228,220 +551,285 @@ def chat_with_openai(message, model='gpt-4o', use_memory=True):
             'temperature': 0.7
         }
         
-        response = requests.post('https://api.openai.com/v1/chat/completions', headers=headers, json=data)
+        response = http_session.post('https://api.openai.com/v1/chat/completions', headers=OPENAI_HEADERS, data=orjson.dumps(data), timeout=UPSTREAM_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
             ai_response = result['choices'][0]['message']['content']
             tokens_used = result['usage']['total_tokens']
             
-            return jsonify({
+            return {
                 'success': True,
                 'response': ai_response,
                 'model': model,
                 'tokens_used': tokens_used,
                 'provider': 'openai'
-            })
+            }, 200
         else:
-            return jsonify({'success': False, 'error': f'OpenAI API error: {response.text}'}), response.status_code
+            return {'success': False, 'error': f'OpenAI API error: {response.text}'}, response.status_code
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
 
-def chat_with_openai_image(message, image_data, use_memory=True):
-    """Chat with OpenAI models using image input"""
+def sse_event(payload):
+    """Format a payload as a server-sent event"""
+    return f"data: {orjson.dumps(payload).decode('utf-8')}\n\n"
+
+def upstream_events(response):
+    """Decode the JSON payloads of a provider's server-sent event stream"""
+    # Each payload line is "data: {json}"; OpenAI ends the stream with "data: [DONE]"
+    for line in response.iter_lines():
+        if not line.startswith(b'data: '):
+            continue
+        chunk = line[6:]
+        if chunk == b'[DONE]':
+            break
+        yield orjson.loads(chunk)
+
+def document_text_parts(message, document_data, document_name):
+    """Split a question about a document into text parts, keeping the document body as its own part"""
+    # Sending the body as a separate part avoids copying the whole document into one prompt string
+    return [f"Document: {document_name}", document_data, f"User Question: {message}"]
+
+def document_content(message, document_data, document_name):
+    """Build OpenAI/Anthropic message content for a question about a document"""
+    return [{'type': 'text', 'text': part} for part in document_text_parts(message, document_data, document_name)]
+
+def gemini_document_parts(message, document_data, document_name):
+    """Build Gemini content parts for a question about a document"""
+    return [{'text': part} for part in document_text_parts(message, document_data, document_name)]
+
+def claude_document_content(message, document_data, document_name):
+    """Build Claude message content for a document question, marking the document for prompt caching"""
+    content = document_content(message, document_data, document_name)
+    # The header and document form a prefix shared by every question about the same document
+    content[1]['cache_control'] = {'type': 'ephemeral'}
+    return content
+
+def openai_image_content(message, image_data):
+    """Build OpenAI message content pairing a question with a base64 image"""
+    # Data URLs are forwarded untouched so the payload is not sliced and re-joined; bare base64 is assumed to be JPEG
+    image_url = image_data if image_data.startswith('data:image/') else 'data:image/jpeg;base64,' + image_data
+    
+    return [
+        {'type': 'text', 'text': message},
+        {'type': 'image_url', 'image_url': {'url': image_url}}
+    ]
+
+def stream_openai(content, model='gpt-4o'):
+    """Stream an OpenAI chat completion as server-sent events"""
     try:
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            return jsonify({'success': False, 'error': 'OpenAI API key not configured'}), 500
+        if not OPENAI_API_KEY:
+            yield sse_event({'error': 'OpenAI API key not configured'})
+            return
         
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
+        data = {
+            'model': model,
+            'messages': [{'role': 'user', 'content': content}],
+            'max_tokens': 1000,
+            'temperature': 0.7,
+            'stream': True
         }
         
-        # Remove data URL prefix if present
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
+        with http_session.post('https://api.openai.com/v1/chat/completions', headers=OPENAI_HEADERS, data=orjson.dumps(data), stream=True, timeout=UPSTREAM_TIMEOUT) as response:
+            if response.status_code != 200:
+                yield sse_event({'error': f'OpenAI API error: {response.text}'})
+                return
+            
+            for payload in upstream_events(response):
+                choices = payload.get('choices')
+                text = choices[0].get('delta', {}).get('content') if choices else None
+                if text:
+                    yield sse_event({'delta': text})
+        
+        yield sse_event({'done': True, 'model': model, 'provider': 'openai'})
+        
+    except Exception as e:
+        yield sse_event({'error': str(e)})
+
+def chat_with_openai_image(message, image_data, use_memory=True):
+    """Chat with OpenAI models using image input"""
+    try:
+        if not OPENAI_API_KEY:
+            return {'success': False, 'error': 'OpenAI API key not configured'}, 500
         
         data = {
             'model': 'gpt-4o',
-            'messages': [
-                {
-                    'role': 'user',
-                    'content': [
-                        {'type': 'text', 'text': message},
-                        {'type': 'image_url', 'image_url': {'url': f'data:image/jpeg;base64,{image_data}'}}
-                    ]
-                }
-            ],
+            'messages': [{'role': 'user', 'content': openai_image_content(message, image_data)}],
             'max_tokens': 1000,
             'temperature': 0.7
         }
         
-        response = requests.post('https://api.openai.com/v1/chat/completions', headers=headers, json=data)
+        response = http_session.post('https://api.openai.com/v1/chat/completions', headers=OPENAI_HEADERS, data=orjson.dumps(data), timeout=UPSTREAM_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
             ai_response = result['choices'][0]['message']['content']
             tokens_used = result['usage']['total_tokens']
             
-            return jsonify({
+            return {
                 'success': True,
                 'response': ai_response,
                 'model': 'gpt-4o',
                 'tokens_used': tokens_used,
                 'provider': 'openai'
-            })
+            }, 200
         else:
-            return jsonify({'success': False, 'error': f'OpenAI API error: {response.text}'}), response.status_code
+            return {'success': False, 'error': f'OpenAI API error: {response.text}'}, response.status_code
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
 
 def chat_with_openai_document(message, document_data, document_name, use_memory=True):
     """Chat with OpenAI models using document input"""
     try:
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            return jsonify({'success': False, 'error': 'OpenAI API key not configured'}), 500
-        
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        enhanced_message = f"Document: {document_name}\n\nContent:\n{document_data}\n\nUser Question: {message}"
+        if not OPENAI_API_KEY:
+            return {'success': False, 'error': 'OpenAI API key not configured'}, 500
         
         data = {
             'model': 'gpt-4o',
-            'messages': [{'role': 'user', 'content': enhanced_message}],
+            'messages': [{'role': 'user', 'content': document_content(message, document_data, document_name)}],
             'max_tokens': 1000,
             'temperature': 0.7
         }
         
-        response = requests.post('https://api.openai.com/v1/chat/completions', headers=headers, json=data)
+        response = http_session.post('https://api.openai.com/v1/chat/completions', headers=OPENAI_HEADERS, data=orjson.dumps(data), timeout=UPSTREAM_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
             ai_response = result['choices'][0]['message']['content']
             tokens_used = result['usage']['total_tokens']
             
-            return jsonify({
+            return {
                 'success': True,
                 'response': ai_response,
                 'model': 'gpt-4o',
                 'tokens_used': tokens_used,
                 'provider': 'openai'
-            })
+            }, 200
         else:
-            return jsonify({'success': False, 'error': f'OpenAI API error: {response.text}'}), response.status_code
+            return {'success': False, 'error': f'OpenAI API error: {response.text}'}, response.status_code
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
 
 # Claude Integration
+# Public Claude model names mapped to Anthropic API model ids
+CLAUDE_MODELS = {
+    'claude-3-sonnet': 'claude-3-5-sonnet-20241022',
+    'claude-3-haiku': 'claude-3-haiku-20240307'
+}
+
 def chat_with_claude(message, model='claude-3-sonnet', use_memory=True):
     """Chat with Claude models"""
     try:
-        api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not api_key:
-            return jsonify({'success': False, 'error': 'Anthropic API key not configured'}), 500
-        
-        headers = {
-            'x-api-key': api_key,
-            'Content-Type': 'application/json',
-            'anthropic-version': '2023-06-01'
-        }
-        
-        # Map model names to Claude API format
-        model_mapping = {
-            'claude-3-sonnet': 'claude-3-5-sonnet-20241022',
-            'claude-3-haiku': 'claude-3-haiku-20240307'
-        }
-        
-        claude_model = model_mapping.get(model, 'claude-3-5-sonnet-20241022')
+        if not ANTHROPIC_API_KEY:
+            return {'success': False, 'error': 'Anthropic API key not configured'}, 500
         
         data = {
-            'model': claude_model,
+            'model': CLAUDE_MODELS.get(model, CLAUDE_MODELS['claude-3-sonnet']),
             'max_tokens': 1000,
             'messages': [{'role': 'user', 'content': message}]
         }
         
-        response = requests.post('https://api.anthropic.com/v1/messages', headers=headers, json=data)
+        response = http_session.post('https://api.anthropic.com/v1/messages', headers=ANTHROPIC_HEADERS, data=orjson.dumps(data), timeout=UPSTREAM_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
             ai_response = result['content'][0]['text']
             
-            return jsonify({
+            return {
                 'success': True,
                 'response': ai_response,
                 'model': model,
                 'provider': 'anthropic'
-            })
+            }, 200
         else:
-            return jsonify({'success': False, 'error': f'Claude API error: {response.text}'}), response.status_code
+            return {'success': False, 'error': f'Claude API error: {response.text}'}, response.status_code
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
 
 def chat_with_claude_document(message, document_data, document_name, use_memory=True):
     """Chat with Claude models using document input"""
     try:
-        api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not api_key:
-            return jsonify({'success': False, 'error': 'Anthropic API key not configured'}), 500
-        
-        headers = {
-            'x-api-key': api_key,
-            'Content-Type': 'application/json',
-            'anthropic-version': '2023-06-01'
-        }
-        
-        enhanced_message = f"Document: {document_name}\n\nContent:\n{document_data}\n\nUser Question: {message}"
+        if not ANTHROPIC_API_KEY:
+            return {'success': False, 'error': 'Anthropic API key not configured'}, 500
         
         data = {
             'model': 'claude-3-5-sonnet-20241022',
             'max_tokens': 1000,
-            'messages': [{'role': 'user', 'content': enhanced_message}]
+            'messages': [{'role': 'user', 'content': claude_document_content(message, document_data, document_name)}]
         }
         
-        response = requests.post('https://api.anthropic.com/v1/messages', headers=headers, json=data)
+        response = http_session.post('https://api.anthropic.com/v1/messages', headers=ANTHROPIC_HEADERS, data=orjson.dumps(data), timeout=UPSTREAM_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
             ai_response = result['content'][0]['text']
             
-            return jsonify({
+            return {
                 'success': True,
                 'response': ai_response,
                 'model': 'claude-3-sonnet',
                 'provider': 'anthropic'
-            })
+            }, 200
         else:
-            return jsonify({'success': False, 'error': f'Claude API error: {response.text}'}), response.status_code
+            return {'success': False, 'error': f'Claude API error: {response.text}'}, response.status_code
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
+
+def stream_claude(content, model='claude-3-sonnet'):
+    """Stream a Claude message as server-sent events"""
+    try:
+        if not ANTHROPIC_API_KEY:
+            yield sse_event({'error': 'Anthropic API key not configured'})
+            return
+        
+        data = {
+            'model': CLAUDE_MODELS.get(model, CLAUDE_MODELS['claude-3-sonnet']),
+            'max_tokens': 1000,
+            'messages': [{'role': 'user', 'content': content}],
+            'stream': True
+        }
+        
+        with http_session.post('https://api.anthropic.com/v1/messages', headers=ANTHROPIC_HEADERS, data=orjson.dumps(data), stream=True, timeout=UPSTREAM_TIMEOUT) as response:
+            if response.status_code != 200:
+                yield sse_event({'error': f'Claude API error: {response.text}'})
+                return
+            
+            # Text arrives in content_block_delta events; errors can also be reported mid-stream
+            for payload in upstream_events(response):
+                if payload.get('type') == 'content_block_delta':
+                    text = payload['delta'].get('text')
+                    if text:
+                        yield sse_event({'delta': text})
+                elif payload.get('type') == 'error':
+                    yield sse_event({'error': f"Claude API error: {payload['error'].get('message')}"})
+                    return
+        
+        yield sse_event({'done': True, 'model': model, 'provider': 'anthropic'})
+        
+    except Exception as e:
+        yield sse_event({'error': str(e)})
 
 # Gemini Integration
+# Public Gemini model names mapped to Google API model ids
+GEMINI_MODELS = {
+    'gemini-1.5-pro': 'gemini-1.5-pro',
+    'gemini-1.5-flash': 'gemini-1.5-flash'
+}
+
 def chat_with_gemini(message, model='gemini-1.5-pro', use_memory=True):
     """Chat with Gemini models"""
     try:
-        api_key = os.environ.get('GOOGLE_API_KEY')
-        if not api_key:
-            return jsonify({'success': False, 'error': 'Google API key not configured'}), 500
-        
-        # Map model names to Gemini API format
-        model_mapping = {
-            'gemini-1.5-pro': 'gemini-1.5-pro',
-            'gemini-1.5-flash': 'gemini-1.5-flash'
-        }
+        if not GOOGLE_API_KEY:
+            return {'success': False, 'error': 'Google API key not configured'}, 500
         
-        gemini_model = model_mapping.get(model, 'gemini-1.5-pro')
+        gemini_model = GEMINI_MODELS.get(model, GEMINI_MODELS['gemini-1.5-pro'])
         
-        url = f'https://generativelanguage.googleapis.com/v1beta/models/{gemini_model}:generateContent?key={api_key}'
+        url = f'{GEMINI_API_URL}/{gemini_model}:generateContent'
         
         data = {
             'contents': [{
@@ -453,38 +841,35 @@ def chat_with_gemini(message, model='gemini-1.5-pro', use_memory=True):
             }
         }
         
-        response = requests.post(url, json=data)
+        response = http_session.post(url, headers=GEMINI_HEADERS, data=orjson.dumps(data), timeout=UPSTREAM_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
             ai_response = result['candidates'][0]['content']['parts'][0]['text']
             
-            return jsonify({
+            return {
                 'success': True,
                 'response': ai_response,
                 'model': model,
                 'provider': 'google'
-            })
+            }, 200
         else:
-            return jsonify({'success': False, 'error': f'Gemini API error: {response.text}'}), response.status_code
+            return {'success': False, 'error': f'Gemini API error: {response.text}'}, response.status_code
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
 
 def chat_with_gemini_document(message, document_data, document_name, use_memory=True):
     """Chat with Gemini models using document input"""
     try:
-        api_key = os.environ.get('GOOGLE_API_KEY')
-        if not api_key:
-            return jsonify({'success': False, 'error': 'Google API key not configured'}), 500
+        if not GOOGLE_API_KEY:
+            return {'success': False, 'error': 'Google API key not configured'}, 500
         
-        enhanced_message = f"Document: {document_name}\n\nContent:\n{document_data}\n\nUser Question: {message}"
-        
-        url = f'https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-pro:generateContent?key={api_key}'
+        url = f'{GEMINI_API_URL}/gemini-1.5-pro:generateContent'
         
         data = {
             'contents': [{
-                'parts': [{'text': enhanced_message}]
+                'parts': gemini_document_parts(message, document_data, document_name)
             }],
             'generationConfig': {
                 'maxOutputTokens': 1000,
@@ -492,231 +877,265 @@ def chat_with_gemini_document(message, document_data, document_name, use_memory=
             }
         }
         
-        response = requests.post(url, json=data)
+        response = http_session.post(url, headers=GEMINI_HEADERS, data=orjson.dumps(data), timeout=UPSTREAM_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
             ai_response = result['candidates'][0]['content']['parts'][0]['text']
             
-            return jsonify({'success': True, 'response': ai_response, 'model': 'gemini-1.5-pro', 'provider': 'google'})
+            return {'success': True, 'response': ai_response, 'model': 'gemini-1.5-pro', 'provider': 'google'}, 200
         else:
-            return jsonify({'success': False, 'error': f'Gemini API error: {response.text}'}), response.status_code
+            return {'success': False, 'error': f'Gemini API error: {response.text}'}, response.status_code
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
 
-@app.route('/api/personalities', methods=['GET'])
-def get_personalities():
-    """Get available AI personalities"""
+def stream_gemini(content, model='gemini-1.5-pro'):
+    """Stream a Gemini completion as server-sent events"""
     try:
-        from simple_openai import AdvancedOpenAI
-        ai = AdvancedOpenAI()
+        if not GOOGLE_API_KEY:
+            yield sse_event({'error': 'Google API key not configured'})
+            return
         
-        personalities = ai.get_available_personalities()
-        current_personality = session.get('personality', 'default')
+        gemini_model = GEMINI_MODELS.get(model, GEMINI_MODELS['gemini-1.5-pro'])
         
-        return jsonify({
-            'success': True,
-            'personalities': personalities,
-            'current_personality': current_personality
-        })
+        # alt=sse makes streamGenerateContent answer with server-sent events instead of a JSON array
+        url = f'{GEMINI_API_URL}/{gemini_model}:streamGenerateContent?alt=sse'
+        
+        # A plain message becomes a single text part; document questions arrive already split into parts
+        data = {
+            'contents': [{
+                'parts': [{'text': content}] if isinstance(content, str) else content
+            }],
+            'generationConfig': {
+                'maxOutputTokens': 1000,
+                'temperature': 0.7
+            }
+        }
+        
+        with http_session.post(url, headers=GEMINI_HEADERS, data=orjson.dumps(data), stream=True, timeout=UPSTREAM_TIMEOUT) as response:
+            if response.status_code != 200:
+                yield sse_event({'error': f'Gemini API error: {response.text}'})
+                return
+            
+            for payload in upstream_events(response):
+                candidates = payload.get('candidates')
+                parts = candidates[0].get('content', {}).get('parts', []) if candidates else []
+                text = ''.join(part.get('text', '') for part in parts)
+                if text:
+                    yield sse_event({'delta': text})
+        
+        yield sse_event({'done': True, 'model': model, 'provider': 'google'})
         
     except Exception as e:
-        logger.error(f'Error getting personalities: {e}')
-        return jsonify({
-            'success': False,
-            'error': 'Failed to get personalities'
-        }), 500
+        yield sse_event({'error': str(e)})
+
+# Provider helpers for each kind of request, keyed by model_provider()
+# Each returns a (payload dict, status) pair that routes hand straight back to Flask to serialize
+CHAT_HANDLERS = {'openai': chat_with_openai, 'anthropic': chat_with_claude, 'google': chat_with_gemini}
+STREAM_HANDLERS = {'openai': stream_openai, 'anthropic': stream_claude, 'google': stream_gemini}
+IMAGE_HANDLERS = {'openai': chat_with_openai_image}
+DOCUMENT_HANDLERS = {
+    'openai': chat_with_openai_document,
+    'anthropic': chat_with_claude_document,
+    'google': chat_with_gemini_document
+}
+
+# Streaming counterparts of the image and document helpers, using the same model and content as each one
+IMAGE_STREAM_HANDLERS = {
+    'openai': lambda message, image_data: stream_openai(openai_image_content(message, image_data), 'gpt-4o')
+}
+DOCUMENT_STREAM_HANDLERS = {
+    'openai': lambda message, document_data, document_name: stream_openai(document_content(message, document_data, document_name), 'gpt-4o'),
+    'anthropic': lambda message, document_data, document_name: stream_claude(claude_document_content(message, document_data, document_name), 'claude-3-sonnet'),
+    'google': lambda message, document_data, document_name: stream_gemini(gemini_document_parts(message, document_data, document_name), 'gemini-1.5-pro')
+}
+
+@app.route('/api/personalities', methods=['GET'])
+def get_personalities():
+    """Get available AI personalities"""
+    current_personality = session.get('personality', 'default')
+    
+    if current_personality in PERSONALITIES_RESPONSES:
+        return static_asset_response(PERSONALITIES_RESPONSES[current_personality], 'application/json')
+    
+    return jsonify({
+        'success': True,
+        'personalities': AVAILABLE_PERSONALITIES,
+        'current_personality': current_personality
+    })
 
 @app.route('/api/personality', methods=['POST'])
 def change_personality():
     """Change AI personality"""
-    try:
-        data = request.get_json()
-        if not data or 'personality' not in data:
-            return jsonify({'error': 'Personality is required'}), 400
-        
-        personality = data['personality']
-        from simple_openai import AdvancedOpenAI
-        ai = AdvancedOpenAI()
-        
-        result = ai.change_personality(personality)
-        if result['success']:
-            session['personality'] = personality
-            return jsonify({
-                'success': True,
-                'personality': personality,
-                'message': f'AI personality changed to {personality}'
-            })
-        else:
-            return jsonify({'error': result['error']}), 400
-            
-    except Exception as e:
-        logger.error(f'Error changing personality: {e}')
-        return jsonify({'error': 'Failed to change personality'}), 500
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'personality' not in data:
+        return jsonify({'error': 'Personality is required'}), 400
+    
+    personality = data['personality']
+    result = ai.change_personality(personality)
+    if result['success']:
+        session['personality'] = personality
+        return jsonify({
+            'success': True,
+            'personality': personality,
+            'message': f'AI personality changed to {personality}'
+        })
+    else:
+        return jsonify({'error': result['error']}), 400
 
 @app.route('/api/clear-conversation', methods=['POST'])
 def clear_conversation():
     """Clear conversation history for current user"""
-    try:
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'No user session found'}), 400
-        
-        from simple_openai import AdvancedOpenAI
-        ai = AdvancedOpenAI()
-        
-        result = ai.clear_conversation(user_id)
-        return jsonify(result)
-        
-    except Exception as e:
-        logger.error(f'Error clearing conversation: {e}')
-        return jsonify({'error': 'Failed to clear conversation'}), 500
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'No user session found'}), 400
+    
+    result = ai.clear_conversation(user_id)
+    return jsonify(result)
 
 @app.route('/api/conversation-info', methods=['GET'])
 def get_conversation_info():
     """Get conversation information for current user"""
-    try:
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'No user session found'}), 400
-        
-        from simple_openai import AdvancedOpenAI
-        ai = AdvancedOpenAI()
-        
-        context = ai.get_conversation_context(user_id)
-        return jsonify({
-            'success': True,
-            'conversation_length': len(context),
-            'user_id': user_id,
-            'personality': session.get('personality', 'default')
-        })
-        
-    except Exception as e:
-        logger.error(f'Error getting conversation info: {e}')
-        return jsonify({'error': 'Failed to get conversation info'}), 500
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'No user session found'}), 400
+    
+    context = ai.get_conversation_context(user_id)
+    return jsonify({
+        'success': True,
+        'conversation_length': len(context),
+        'user_id': user_id,
+        'personality': session.get('personality', 'default')
+    })
 
 @app.route('/api/real-time-capabilities', methods=['GET'])
 def get_real_time_capabilities():
     """Get available real-time information services"""
-    try:
-        from simple_openai import AdvancedOpenAI
-        ai = AdvancedOpenAI()
-        
-        capabilities = ai.get_real_time_capabilities()
-        return jsonify({
-            'success': True,
-            'capabilities': capabilities,
-            'note': 'Some services require API keys to be configured'
-        })
-        
-    except Exception as e:
-        logger.error(f'Error getting real-time capabilities: {e}')
-        return jsonify({'error': 'Failed to get real-time capabilities'}), 500
+    return static_asset_response(REAL_TIME_CAPABILITIES, 'application/json')
+
+# Sample lookup run by /api/test-real-time/<service> for each service
+REAL_TIME_TESTS = {
+    'weather': lambda rt: rt.get_weather('London'),
+    'time': lambda rt: {"time": rt.get_time(), "timezone": "UTC"},
+    'crypto': lambda rt: rt.get_crypto_price('bitcoin'),
+    'news': lambda rt: rt.get_news(),
+    'stocks': lambda rt: rt.get_stock_price('AAPL')
+}
+
+# Seconds an upstream sample is reused so bursts of test requests share one external call; time is local and never cached
+REAL_TIME_TEST_TTLS = {'weather': 30, 'crypto': 30, 'news': 30, 'stocks': 30}
 
 @app.route('/api/test-real-time/<service>', methods=['GET'])
 def test_real_time_service(service):
     """Test a specific real-time service"""
-    try:
-        from simple_openai import RealTimeInfo
-        rt = RealTimeInfo()
-        
-        if service == 'weather':
-            result = rt.get_weather('London')
-        elif service == 'time':
-            result = {"time": rt.get_current_time(), "timezone": "Local"}
-        elif service == 'crypto':
-            result = rt.get_crypto_price('bitcoin')
-        elif service == 'news':
-            result = rt.get_news_headlines()
-        elif service == 'stocks':
-            result = rt.get_stock_price('AAPL')
-        else:
-            return jsonify({'error': 'Unknown service'}), 400
-        
-        return jsonify({
-            'success': True,
-            'service': service,
-            'data': result,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        logger.error(f'Error testing real-time service {service}: {e}')
-        return jsonify({'error': f'Failed to test {service} service'}), 500
+    handler = REAL_TIME_TESTS.get(service)
+    if not handler:
+        return jsonify({'error': 'Unknown service'}), 400
+    
+    ttl = REAL_TIME_TEST_TTLS.get(service)
+    cache_key = response_cache_key('test-real-time', service) if ttl else None
+    result = get_cached_response(cache_key) if cache_key else None
+    if result is None:
+        result = handler(ai.real_time)
+        if cache_key:
+            cache_response(cache_key, result, ttl)
+    
+    return jsonify({
+        'success': True,
+        'service': service,
+        'data': result,
+        'timestamp': current_timestamp()
+    })
 
 @app.route('/api/models')
 def get_models():
     """Get available AI models"""
-    try:
-        from simple_openai import AdvancedOpenAI
-        ai = AdvancedOpenAI()
-        models = ai.get_available_models()
-        return jsonify({
-            'success': True,
-            'models': models,
-            'default_provider': ai.default_provider,
-            'default_model': ai.default_model
-        })
-    except Exception as e:
-        logger.error(f'Error getting models: {e}')
-        return jsonify({'error': 'Failed to get models'}), 500
+    models = ai.get_available_models()
+    return jsonify({
+        'success': True,
+        'models': models,
+        'default_provider': ai.default_provider,
+        'default_model': ai.default_model
+    })
+
+# Query-string arguments each real-time query type accepts, with their defaults
+REAL_TIME_QUERY_PARAMS = {
+    'weather': lambda args: {'city': args.get('city', 'New York')},
+    'time': lambda args: {'timezone': args.get('timezone', 'UTC')},
+    'crypto': lambda args: {'symbol': args.get('symbol', 'BTC')},
+    'news': lambda args: {'topic': args.get('topic', 'technology'), 'limit': args.get('limit', 3, type=int)},
+    'stocks': lambda args: {'symbol': args.get('symbol', 'BTC')}
+}
 
 @app.route('/api/real-time/<query_type>')
 def get_real_time_info(query_type):
     """Get real-time information"""
-    try:
-        from simple_openai import AdvancedOpenAI
-        ai = AdvancedOpenAI()
-        
-        # Get query parameters
-        city = request.args.get('city', 'New York')
-        timezone = request.args.get('timezone', 'UTC')
-        symbol = request.args.get('symbol', 'BTC')
-        topic = request.args.get('topic', 'technology')
-        limit = request.args.get('limit', 3, type=int)
-        
-        # Get real-time information
-        if query_type == 'weather':
-            info = ai.get_real_time_info('weather', city=city)
-        elif query_type == 'time':
-            info = ai.get_real_time_info('time', timezone=timezone)
-        elif query_type == 'crypto':
-            info = ai.get_real_time_info('crypto', symbol=symbol)
-        elif query_type == 'news':
-            info = ai.get_real_time_info('news', topic=topic, limit=limit)
-        elif query_type == 'stocks':
-            info = ai.get_real_time_info('stocks', symbol=symbol)
-        else:
-            return jsonify({'error': 'Invalid query type'}), 400
-        
-        return jsonify({
-            'success': True,
-            'query_type': query_type,
-            'data': info,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        logger.error(f'Real-time info error: {e}')
-        return jsonify({'error': 'Failed to get real-time information'}), 500
+    params = REAL_TIME_QUERY_PARAMS.get(query_type)
+    if not params:
+        return jsonify({'error': 'Invalid query type'}), 400
+    
+    info = ai.get_real_time_info(query_type, **params(request.args))
+    
+    return jsonify({
+        'success': True,
+        'query_type': query_type,
+        'data': info,
+        'timestamp': current_timestamp()
+    })
+
+@app.route('/api/real-time/all')
+def get_all_real_time_info():
+    """Get all real-time information, fetching every service concurrently"""
+    queries = {
+        query_type: params(request.args)
+        for query_type, params in REAL_TIME_QUERY_PARAMS.items()
+    }
+    
+    # Total latency is the slowest service rather than the sum of all of them. The pool is per request so
+    # concurrent requests don't queue behind each other, and it isn't joined so the deadline below holds
+    executor = ThreadPoolExecutor(max_workers=len(queries))
+    futures = {
+        query_type: executor.submit(ai.get_real_time_info, query_type, **kwargs)
+        for query_type, kwargs in queries.items()
+    }
+    executor.shutdown(wait=False)
+    
+    deadline = time.monotonic() + REAL_TIME_ALL_TIMEOUT
+    info = {}
+    for query_type, future in futures.items():
+        try:
+            info[query_type] = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            info[query_type] = f"{query_type.capitalize()} data unavailable (timed out)"
+    
+    return jsonify({
+        'success': True,
+        'data': info,
+        'timestamp': current_timestamp()
+    })
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({'error': 'Endpoint not found'}), 404
+    return json_response(NOT_FOUND_JSON, 404)
+
+@app.errorhandler(413)
+def payload_too_large(error):
+    return json_response(PAYLOAD_TOO_LARGE_JSON, 413)
 
 @app.errorhandler(500)
 def internal_error(error):
-    logger.error(f'Internal server error: {error}')
-    return jsonify({'error': 'Internal server error'}), 500
+    logger.error('Internal server error: %s', error)
+    return json_response(INTERNAL_ERROR_JSON, 500)
 
 if __name__ == '__main__':
-    debug_mode = os.environ.get('FLASK_ENV') == 'development'
+    debug_mode = FLASK_ENV == 'development'
     port = int(os.environ.get('PORT', 8080))
     
     if debug_mode:
         logger.info('Starting Flask app in development mode')
         app.run(debug=True, host='0.0.0.0', port=port)
     else:
+        from gevent.pywsgi import WSGIServer
         logger.info('Starting Flask app in production mode')
-        app.run(debug=False, host='0.0.0.0', port=port)
+        WSGIServer(('0.0.0.0', port), app).serve_forever()
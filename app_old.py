@@ -1,11 +1,20 @@
 # -*- coding: utf-8 -*-
 from flask import Flask, render_template, request, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
 import os
 from datetime import datetime
 import re
+import time
+import threading
+from collections import OrderedDict
 
 app = Flask(__name__)
+# X-Forwarded-* headers are only trusted when that many proxies (e.g. the platform router) sit in front of the
+# app; otherwise any client could set its own address and dodge the rate limiter
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
 app.config['SECRET_KEY'] = Config.FLASK_SECRET_KEY
 
 #    SECURITY HEADERS - Protects against XSS, clickjacking, etc.
@@ -31,49 +40,73 @@ def privacy():
     return render_template('privacy.html')
 
 # 🚫 RATE LIMITING - Prevents abuse (30 requests/minute)
-rate_limit_store = {}
+# Token bucket per IP: (tokens, last_refill) - refilled lazily, O(1) per request
+# Ordered by recency so the least recently seen IP is evicted once the cap is reached
+rate_limit_store = OrderedDict()
+rate_limit_lock = threading.Lock()
 MAX_REQUESTS_PER_MINUTE = 30
+MAX_TRACKED_IPS = 100000
+REFILL_RATE = MAX_REQUESTS_PER_MINUTE / 60.0  # tokens per second
+
+def available_tokens(ip, now):
+    """Tokens left in an IP's bucket after refilling for the time elapsed"""
+    tokens, last_refill = rate_limit_store.get(ip, (MAX_REQUESTS_PER_MINUTE, now))
+    return min(MAX_REQUESTS_PER_MINUTE, tokens + (now - last_refill) * REFILL_RATE)
 
 def check_rate_limit(ip):
     """Simple rate limiting by IP address"""
-    current_time = datetime.now().timestamp()
-    
-    if ip not in rate_limit_store:
-        rate_limit_store[ip] = []
-    
-    # Clean old requests (older than 1 minute)
-    rate_limit_store[ip] = [
-        req_time for req_time in rate_limit_store[ip]
-        if current_time - req_time < 60
-    ]
-    
-    # Check if limit exceeded
-    if len(rate_limit_store[ip]) >= MAX_REQUESTS_PER_MINUTE:
-        return False
-    
-    # Add current request
-    rate_limit_store[ip].append(current_time)
-    return True
+    # Serialize the read-refill-write so concurrent requests can't spend the same token
+    with rate_limit_lock:
+        now = time.monotonic()
+        tokens = available_tokens(ip, now)
+        
+        # Check if limit exceeded
+        if tokens < 1:
+            return False
+        
+        # Spend a token for the current request
+        rate_limit_store[ip] = (tokens - 1, now)
+        rate_limit_store.move_to_end(ip)
+        if len(rate_limit_store) > MAX_TRACKED_IPS:
+            rate_limit_store.popitem(last=False)
+        return True
 
 #    INPUT SANITIZATION - Prevents XSS and injection attacks
+DANGEROUS_TAG_RE = re.compile(r'</?(?:script|iframe|object|embed|svg)\b[^>]*>', re.IGNORECASE)
+# Event handlers ('on\w+\s*=') are found per attribute name rather than at every 'on', so a long
+# run of word characters is scanned once instead of once per position (quadratic backtracking)
+ATTR_ASSIGN_RE = re.compile(r'\b(\w+)\s*=')
+EVENT_PREFIX_RE = re.compile(r'on(?=\w)', re.IGNORECASE)
+# Plain prose without '<' or '=' can't contain either pattern above
+SAFE_TEXT_RE = re.compile(r'[\w\s.,?!:;\'"-]*')
+MAX_INPUT_LENGTH = 1000
+
+def strip_event_handler(match):
+    """Drop an 'on...=' event handler from an attribute assignment, keeping the text before it"""
+    name = match.group(1)
+    event = EVENT_PREFIX_RE.search(name)
+    return name[:event.start()] if event else match.group()
+
 def sanitize_input(user_input):
     """Simple input sanitization"""
     if not user_input:
         return ""
     
-    # Remove dangerous HTML tags
-    dangerous_tags = ['<script>', '</script>', '<iframe>', '</iframe>', '<object>', '</object>']
-    sanitized = user_input
+    # Fast path: short benign text needs no cleaning
+    if len(user_input) <= MAX_INPUT_LENGTH and SAFE_TEXT_RE.fullmatch(user_input):
+        return user_input.strip()
     
-    for tag in dangerous_tags:
-        sanitized = sanitized.replace(tag, '')
+    # Remove dangerous HTML tags (in any case and with attributes) in a single pass
+    # Tags end in '>', so text after the last one can't match and isn't scanned
+    tags_end = user_input.rfind('>') + 1
+    sanitized = DANGEROUS_TAG_RE.sub('', user_input[:tags_end]) + user_input[tags_end:]
     
     # Remove JavaScript events
-    sanitized = re.sub(r'on\w+\s*=', '', sanitized, flags=re.IGNORECASE)
+    sanitized = ATTR_ASSIGN_RE.sub(strip_event_handler, sanitized)
     
     # Limit length
-    if len(sanitized) > 1000:
-        sanitized = sanitized[:1000]
+    if len(sanitized) > MAX_INPUT_LENGTH:
+        sanitized = sanitized[:MAX_INPUT_LENGTH]
     
     return sanitized.strip()
 
@@ -117,7 +150,7 @@ def chat_api():
         return jsonify({
             'response': response,
             'timestamp': datetime.now().isoformat(),
-            'message_id': f"msg_{datetime.now().timestamp()}"
+            'message_id': f"msg_{time.time()}"
         })
         
     except Exception as e:
@@ -133,7 +166,7 @@ def security_status():
     client_ip = request.remote_addr
     
     # Get current rate limit info
-    current_requests = len(rate_limit_store.get(client_ip, []))
+    current_requests = MAX_REQUESTS_PER_MINUTE - int(available_tokens(client_ip, time.monotonic()))
     
     return jsonify({
         'security_status': {
@@ -222,11 +255,12 @@ def export_user_data():
     try:
         data = request.get_json()
         user_id = data.get('user_id', 'anonymous')
+        now = datetime.now()
         
         # Simulate user data export
         export_data = {
             'user_id': user_id,
-            'export_timestamp': datetime.now().isoformat(),
+            'export_timestamp': now.isoformat(),
             'conversation_history': [
                 {
                     'message': 'Hello, how can I help you?',
@@ -255,7 +289,7 @@ def export_user_data():
         return jsonify({
             'success': True,
             'data': export_data,
-            'download_url': f'/api/download/export_{user_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json',
+            'download_url': f'/api/download/export_{user_id}_{now.strftime("%Y%m%d_%H%M%S")}.json',
             'message': 'Data export completed successfully'
         })
         
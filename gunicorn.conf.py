@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Gunicorn settings for production (see Procfile)
+import multiprocessing
+import os
+
+# Heroku sets WEB_CONCURRENCY per dyno size; fall back to the usual 2 * CPUs + 1
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Greenlet workers keep serving other requests while one waits on an AI provider
+worker_class = 'gevent'
+worker_connections = 1000
+
+# Reuse client connections instead of closing after every response
+keepalive = 75
+
+# With gevent workers this only bounds how long a worker may go without heartbeating the arbiter (i.e. a
+# blocked event loop); it does not limit individual requests, which are bounded by UPSTREAM_TIMEOUT instead
+timeout = 120
+
+# On a restart or deploy, in-flight requests such as long streamed completions get this long to finish
+graceful_timeout = 120
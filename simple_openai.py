@@ -5,16 +5,32 @@ Advanced OpenAI Module - Enhanced AI features with GPT-4o (latest), system promp
 
 import os
 import requests
-import json
-import time
 from datetime import datetime
-from collections import defaultdict
-import uuid
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Seconds allowed to establish a connection; read timeouts are set per call
+CONNECT_TIMEOUT = 5
+
+def create_http_session():
+    """Create a keep-alive HTTP session with a pooled, retrying adapter"""
+    session = requests.Session()
+    # Only failed connections are retried; a read timeout or error status is returned at once so a
+    # dead upstream can't multiply the per-call timeout
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=100,
+        max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.2)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
 class RealTimeInfo:
     """Real-time information service integration"""
     
-    def __init__(self):
+    def __init__(self, session=None):
+        self.session = session or create_http_session()
         self.weather_api_key = os.environ.get('OPENWEATHER_API_KEY')
         self.crypto_api_key = os.environ.get('CRYPTO_API_KEY')
         self.news_api_key = os.environ.get('NEWS_API_KEY')
@@ -27,7 +43,7 @@ class RealTimeInfo:
         
         try:
             url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={self.weather_api_key}&units=metric"
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=(CONNECT_TIMEOUT, 5))
             if response.status_code == 200:
                 data = response.json()
                 temp = data['main']['temp']
@@ -65,7 +81,7 @@ class RealTimeInfo:
         
         try:
             url = f"https://api.coingecko.com/api/v3/simple/price?ids={symbol.lower()}&vs_currencies=usd"
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=(CONNECT_TIMEOUT, 5))
             if response.status_code == 200:
                 data = response.json()
                 if symbol.lower() in data:
@@ -85,7 +101,7 @@ class RealTimeInfo:
         
         try:
             url = f"https://newsapi.org/v2/top-headlines?q={topic}&apiKey={self.news_api_key}&pageSize={limit}"
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=(CONNECT_TIMEOUT, 5))
             if response.status_code == 200:
                 data = response.json()
                 articles = data.get('articles', [])
@@ -110,7 +126,7 @@ class RealTimeInfo:
         try:
             # Using Alpha Vantage API as an example
             url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={self.stocks_api_key}"
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=(CONNECT_TIMEOUT, 5))
             if response.status_code == 200:
                 data = response.json()
                 quote = data.get('Global Quote', {})
@@ -129,13 +145,15 @@ class RealTimeInfo:
 class AdvancedOpenAI:
     """Advanced OpenAI integration with enhanced features"""
     
-    def __init__(self):
+    def __init__(self, session=None):
         self.api_key = os.environ.get('OPENAI_API_KEY')
         self.claude_api_key = os.environ.get('CLAUDE_API_KEY')
         self.gemini_api_key = os.environ.get('GEMINI_API_KEY')
         self.base_url = "https://api.openai.com/v1"
         self.conversation_history = {}
-        self.real_time = RealTimeInfo()
+        # One connection pool shared by every upstream call, including real-time lookups
+        self.session = session or create_http_session()
+        self.real_time = RealTimeInfo(self.session)
         
         # Enhanced system prompts with real-time capabilities
         self.system_prompts = {
@@ -213,6 +231,27 @@ class AdvancedOpenAI:
         """Get list of available AI models with details"""
         return self.available_models
     
+    def get_available_personalities(self):
+        """Get list of available personality names"""
+        return list(self.system_prompts)
+    
+    def change_personality(self, personality):
+        """Validate a personality before a session switches to it"""
+        # The instance is shared by every session, so the choice itself is kept by the caller
+        if isinstance(personality, str) and personality in self.system_prompts:
+            return {'success': True, 'personality': personality}
+        return {'success': False, 'error': f'Unknown personality: {personality}'}
+    
+    def get_real_time_capabilities(self):
+        """Get real-time services and whether each one is configured"""
+        return {
+            'weather': bool(self.real_time.weather_api_key),
+            'time': True,
+            'crypto': bool(self.real_time.crypto_api_key),
+            'news': bool(self.real_time.news_api_key),
+            'stocks': bool(self.real_time.stocks_api_key)
+        }
+    
     def get_model_info(self, provider, model):
         """Get information about a specific model"""
         if provider in self.available_models and model in self.available_models[provider]:
@@ -296,11 +335,11 @@ class AdvancedOpenAI:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/chat/completions",
                 headers=headers,
                 json=data,
-                timeout=60
+                timeout=(CONNECT_TIMEOUT, 60)
             )
             
             if response.status_code == 200:
@@ -383,11 +422,11 @@ class AdvancedOpenAI:
                 "anthropic-version": "2023-06-01"
             }
             
-            response = requests.post(
+            response = self.session.post(
                 "https://api.anthropic.com/v1/messages",
                 headers=headers,
                 json=data,
-                timeout=60
+                timeout=(CONNECT_TIMEOUT, 60)
             )
             
             if response.status_code == 200:
@@ -477,11 +516,11 @@ class AdvancedOpenAI:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={self.gemini_api_key}",
                 headers=headers,
                 json=data,
-                timeout=60
+                timeout=(CONNECT_TIMEOUT, 60)
             )
             
             if response.status_code == 200:
@@ -563,11 +602,11 @@ class AdvancedOpenAI:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/chat/completions",
                 headers=headers,
                 json=data,
-                timeout=120  # Longer timeout for image analysis
+                timeout=(CONNECT_TIMEOUT, 120)  # Longer timeout for image analysis
             )
             
             if response.status_code == 200:
@@ -608,9 +647,10 @@ class AdvancedOpenAI:
             "timestamp": datetime.now().isoformat()
         })
         
-        # Keep only last 50 messages to prevent memory issues
-        if len(self.conversation_history[user_id]) > 50:
-            self.conversation_history[user_id] = self.conversation_history[user_id][-50:]
+        # Keep only last 50 messages to prevent memory issues (trimmed in place, no list copy)
+        history = self.conversation_history[user_id]
+        if len(history) > 50:
+            del history[:-50]
     
     def clear_conversation(self, user_id):
         """Clear conversation history for a user"""
@@ -638,10 +678,13 @@ class AdvancedOpenAI:
         else:
             return f"Unknown query type: {query_type}"
 
+# Connection pool kept alive across call_openai_direct calls so each one skips the TCP/TLS handshake
+direct_session = create_http_session()
+
 # Backward compatibility function
 def call_openai_direct(message, max_tokens=500, temperature=0.7):
     """Legacy function for backward compatibility"""
-    ai = AdvancedOpenAI()
+    ai = AdvancedOpenAI(direct_session)
     return ai.call_openai(message, max_tokens=max_tokens, temperature=temperature)
 
 if __name__ == "__main__":